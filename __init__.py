@@ -6,7 +6,8 @@ each video with its subtitles or accompanying text where available,
 communicating with an AI API to analyse the contents and summarise them,
 and finally writing the results into a study guide file.  The
 `VideoAnalyzerApp` class in `gui.py` defines the GUI and orchestrates
-the processing flow.
+the processing flow, delegating the concurrent per-video analysis to
+`course_analyzer.py`.
 
 To run the application from the command line, execute `python main.py`.
 """
@@ -9,51 +9,445 @@ to analyse text prompts and return the generated response.
 
 from __future__ import annotations
 
+import asyncio
+import atexit
+import gzip
 import logging
-from typing import List, Optional
+import threading
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, List, Optional, Tuple, TypeVar
 
-import requests  # type: ignore
+import orjson
+
+if TYPE_CHECKING:  # pragma: no cover
+    import httpx  # type: ignore
+
+try:  # Support running as a script or module
+    from .cache import LLMCache
+except ImportError:  # pragma: no cover - fallback for direct execution
+    from cache import LLMCache
+
+API_URL = "https://api.openai.com/v1/chat/completions"
+PREWARM_URL = "https://api.openai.com/v1/models"
+MODEL = "gpt-3.5-turbo"
+TEMPERATURE = 0.2
+
+# Responses are only cached when sampling is close to deterministic;
+# at higher temperatures a repeated prompt is expected to vary.
+CACHE_MAX_TEMPERATURE = 0.2
+_CACHE = LLMCache()
+
+# Statuses that indicate a temporary condition worth retrying, possibly
+# with another key: rate limiting and server-side errors.
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+MAX_BACKOFF = 30
+# Consecutive rate-limit responses after which a key is disabled. Server
+# and network errors are not the key's fault and never count, and of the
+# requests already in flight when a key hits its limit only the first
+# 429 counts.
+KEY_FAILURE_THRESHOLD = 3
+
+_TIMEOUT = 60
+_CONNECT_RETRIES = 2
+
+# Request bodies larger than this many bytes are sent gzip-compressed;
+# subtitles compress several times over. Cleared at runtime if the
+# service turns out not to accept compressed bodies.
+GZIP_MIN_SIZE = 4096
+_compress_requests = True
+
+T = TypeVar("T")
+
+# httpx is only imported, and the shared client built, when the first
+# request is made so that starting the GUI does not pay for them.
+_httpx = None
+_CLIENT: Optional[httpx.Client] = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def _get_httpx():
+    """Import httpx on first use and return the module."""
+    global _httpx
+    if _httpx is None:
+        import httpx as _httpx  # type: ignore
+    return _httpx
+
+
+# Context window of MODEL in tokens, and the tokens the chat format adds
+# around a single user message.
+MODEL_CONTEXT_TOKENS = 16385
+_MESSAGE_OVERHEAD_TOKENS = 8
+# Most tokens MODEL can generate in one answer
+MODEL_OUTPUT_TOKENS = 4096
+
+# The optional tiktoken encoding: None until first needed, False if it
+# cannot be loaded.
+_ENCODING: Any = None
+_ENCODING_LOCK = threading.Lock()
+
+
+def _get_encoding() -> Any:
+    """Return the tiktoken encoding of MODEL, or ``None`` if unavailable."""
+    global _ENCODING
+    if _ENCODING is None:
+        with _ENCODING_LOCK:
+            if _ENCODING is None:
+                try:
+                    import tiktoken  # type: ignore
+
+                    try:
+                        encoding = tiktoken.encoding_for_model(MODEL)
+                    except KeyError:
+                        encoding = tiktoken.get_encoding("cl100k_base")
+                except Exception as exc:  # missing package or encoding download failure
+                    logging.info("Token preflight disabled: %s", exc)
+                    encoding = False
+                _ENCODING = encoding
+    return _ENCODING or None
+
+
+def exceeds_context(prompt: str) -> bool:
+    """Return whether ``prompt`` is too long for the model's context window.
+
+    Tokens are counted locally with the optional ``tiktoken`` package, so
+    an oversized prompt is detected without a round trip. Without
+    ``tiktoken`` this always returns ``False`` and the service's own
+    error is relied upon.
+    """
+    # Every token covers at least one UTF-8 byte, i.e. at most four per
+    # character, so short prompts cannot exceed the limit.
+    if 4 * len(prompt) + _MESSAGE_OVERHEAD_TOKENS <= MODEL_CONTEXT_TOKENS:
+        return False
+    encoding = _get_encoding()
+    if encoding is None:
+        return False
+    tokens = len(encoding.encode(prompt, disallowed_special=()))
+    return tokens + _MESSAGE_OVERHEAD_TOKENS > MODEL_CONTEXT_TOKENS
+
+
+def _transport_options() -> Dict[str, object]:
+    httpx = _get_httpx()
+    # HTTP/2 multiplexes concurrent requests as streams over one
+    # connection, so a pool of 100 connections is plenty; an HTTP/1.1
+    # client would need roughly one connection per in-flight request.
+    limits = httpx.Limits(max_connections=100, max_keepalive_connections=100)
+    # Connection attempts that fail are retried at the transport level;
+    # failed responses are retried by `call_api_with_retry`.
+    return {"http2": True, "limits": limits, "retries": _CONNECT_RETRIES}
+
+
+def get_client() -> httpx.Client:
+    """Return the pooled HTTP client shared by all synchronous API calls.
+
+    Sharing one client lets consecutive requests to the same host reuse an
+    open connection instead of repeating the TCP/TLS handshake.
+    """
+    global _CLIENT
+    if _CLIENT is None:
+        with _CLIENT_LOCK:
+            if _CLIENT is None:
+                httpx = _get_httpx()
+                transport = httpx.HTTPTransport(**_transport_options())
+                _CLIENT = httpx.Client(transport=transport, timeout=_TIMEOUT)
+    return _CLIENT
+
+
+@atexit.register
+def _close_client() -> None:
+    """Close the shared client's pooled connections at interpreter exit."""
+    if _CLIENT is not None:
+        _CLIENT.close()
+
+
+def async_client() -> httpx.AsyncClient:
+    """Create an asynchronous client configured like the shared client.
+
+    An ``AsyncClient`` is bound to the event loop it is used on, so one is
+    created per run rather than at import time. Use it as an async
+    context manager so its connections are closed afterwards.
+    """
+    httpx = _get_httpx()
+    transport = httpx.AsyncHTTPTransport(**_transport_options())
+    return httpx.AsyncClient(transport=transport, timeout=_TIMEOUT)
+
+
+def _prewarm_connection() -> None:
+    """Open a connection to the API host so the first real request skips the handshake."""
+    httpx = _get_httpx()
+    try:
+        get_client().head(PREWARM_URL, timeout=5)
+    except httpx.HTTPError as exc:
+        logging.debug("Connection pre-warm failed: %s", exc)
+
+
+async def prewarm_async(client: httpx.AsyncClient) -> None:
+    """Asynchronous counterpart of `_prewarm_connection` for ``client``'s pool.
+
+    Each run of the analysis uses its own `async_client`, so the
+    connection warmed by `ApiManager` does not help its requests.
+    """
+    httpx = _get_httpx()
+    try:
+        await client.head(PREWARM_URL, timeout=5)
+    except httpx.HTTPError as exc:
+        logging.debug("Connection pre-warm failed: %s", exc)
 
 
 class ApiManager:
     """Simple manager for rotating through multiple API keys.
 
-    This class maintains a list of API keys and an index pointing to the
+    This class maintains a list of API keys and a ring (``deque``) of the
+    indices of keys that are still active. The head of the ring is the
     currently selected key. When an API key is exhausted or otherwise
-    disabled, the `disable_current_key` method marks it inactive and
-    advances the index. The `get_active_key` method returns the next
-    active key or ``None`` if no keys remain.
+    disabled, the `disable_current_key` method removes it from the ring so
+    the next key moves up. The `get_active_key` method returns the current
+    active key or ``None`` if no keys remain, and `next_key` rotates
+    through the ring, skipping keys that are cooling down after a rate
+    limit (see `cool_down`).
+
+    All methods are guarded by a lock, so one manager can be shared by
+    concurrent workers.
+
+    Unless ``prewarm`` is false, constructing a manager also opens a
+    connection to the API host in a background thread. This warms the
+    shared synchronous client used by `call_api` and transcription
+    uploads; asynchronous clients are warmed with `prewarm_async`.
     """
 
-    def __init__(self, api_keys: List[str]) -> None:
+    def __init__(self, api_keys: List[str], prewarm: bool = True) -> None:
         # Initialize all keys as active. Keys can be any non‑empty strings.
-        self.keys = [{"key": k.strip(), "active": True} for k in api_keys if k.strip()]
+        self._keys = [k.strip() for k in api_keys if k.strip()]
+        self._active: Deque[int] = deque(range(len(self._keys)))
+        self._failures: Dict[str, int] = {}
+        # Monotonic time of each key's last counted failure
+        self._failed_at: Dict[str, float] = {}
+        # Monotonic time until which a rate-limited key should be skipped
+        self._cooldown: Dict[int, float] = {}
+        self._lock = threading.RLock()
         self.current_index = 0
-        logging.debug("ApiManager initialised with %d keys", len(self.keys))
+        logging.debug("ApiManager initialised with %d keys", len(self._keys))
+        if prewarm:
+            # Establish the TLS connection in the background while the
+            # caller is still preparing its first prompt.
+            threading.Thread(target=_prewarm_connection, daemon=True).start()
 
     def get_active_key(self) -> Optional[str]:
         """Return the next active API key or ``None`` if none are available."""
-        if not self.keys:
-            logging.debug("No API keys have been configured.")
-            return None
-        for i in range(len(self.keys)):
-            idx = (self.current_index + i) % len(self.keys)
-            if self.keys[idx]["active"]:
-                self.current_index = idx
-                logging.debug("Using API key at index %d", idx)
-                return self.keys[idx]["key"]
-        # No active keys remain
-        logging.warning("All API keys are inactive. Unable to continue sending requests.")
-        return None
+        with self._lock:
+            if not self._keys:
+                logging.debug("No API keys have been configured.")
+                return None
+            if not self._active:
+                # No active keys remain
+                logging.warning("All API keys are inactive. Unable to continue sending requests.")
+                return None
+            idx = self._active[0]
+            self.current_index = idx
+            logging.debug("Using API key at index %d", idx)
+            return self._keys[idx]
 
     def disable_current_key(self) -> None:
         """Mark the current key as inactive. This can be called when a key runs out of quota."""
-        if self.keys:
-            self.keys[self.current_index]["active"] = False
-            logging.info("API key at index %d has been disabled due to quota exhaustion.", self.current_index)
+        with self._lock:
+            if self.current_index in self._active:
+                self._active.remove(self.current_index)
+                logging.info("API key at index %d has been disabled due to quota exhaustion.", self.current_index)
+
+    def next_key(self) -> Optional[str]:
+        """Return an active key and advance past it.
+
+        Unlike `get_active_key`, successive calls rotate through all active
+        keys, which spreads concurrent requests across their rate limits.
+        Keys that are cooling down are skipped; if all of them are, the one
+        that becomes available first is returned.
+        """
+        with self._lock:
+            if not self._active:
+                return self.get_active_key()
+            now = time.monotonic()
+            for _ in range(len(self._active)):
+                idx = self._active[0]
+                self._active.rotate(-1)
+                if self._cooldown.get(idx, 0.0) <= now:
+                    break
+            else:
+                idx = min(self._active, key=lambda i: self._cooldown.get(i, 0.0))
+            self.current_index = idx
+            return self._keys[idx]
+
+    def cool_down(self, api_key: str, seconds: float) -> None:
+        """Skip ``api_key`` in `next_key` for the next ``seconds`` seconds.
+
+        Used when a key hits its rate limit, so that requests go to the
+        other keys instead of waiting for this one.
+        """
+        with self._lock:
+            until = time.monotonic() + seconds
+            for idx, key in enumerate(self._keys):
+                if key == api_key:
+                    self._cooldown[idx] = max(self._cooldown.get(idx, 0.0), until)
+
+    def wait_time(self) -> float:
+        """Return the seconds until an active key is out of its cooldown (0 if one is ready)."""
+        with self._lock:
+            if not self._active:
+                return 0.0
+            now = time.monotonic()
+            return max(0.0, min(self._cooldown.get(idx, 0.0) for idx in self._active) - now)
+
+    def disable_key(self, api_key: str) -> None:
+        """Mark a specific key as inactive.
+
+        Concurrent callers cannot rely on the "current" key, so they
+        disable the exact key that failed instead.
+        """
+        with self._lock:
+            for idx, key in enumerate(self._keys):
+                if key == api_key and idx in self._active:
+                    self._active.remove(idx)
+                    logging.info("API key at index %d has been disabled.", idx)
+
+    def record_failure(
+        self, api_key: str, sent_at: Optional[float] = None, threshold: int = KEY_FAILURE_THRESHOLD
+    ) -> None:
+        """Count a rate-limited request for ``api_key`` and disable it after ``threshold`` in a row.
+
+        ``sent_at`` is the `time.monotonic` time the request was sent. A
+        request sent before the key's last counted failure was already in
+        flight then and is not counted again, so a burst of concurrent
+        requests answered with 429 counts once.
+        """
+        with self._lock:
+            if sent_at is not None and sent_at < self._failed_at.get(api_key, float("-inf")):
+                return
+            self._failed_at[api_key] = time.monotonic()
+            failures = self._failures.get(api_key, 0) + 1
+            self._failures[api_key] = failures
+            if failures >= threshold:
+                logging.warning("API key failed %d times in a row and will no longer be used.", failures)
+                self.disable_key(api_key)
+
+    def record_success(self, api_key: str) -> None:
+        """Reset the consecutive failure count of ``api_key``."""
+        with self._lock:
+            self._failures.pop(api_key, None)
+
+
+def _build_request(prompt: str, api_key: str, compress: bool = True) -> Tuple[Dict[str, str], bytes]:
+    """Return the headers and serialised JSON body for a chat completion request.
+
+    Bodies over `GZIP_MIN_SIZE` bytes are compressed unless ``compress``
+    is false or compression has been found not to work.
+    """
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+    }
+    payload = {
+        "model": MODEL,
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": TEMPERATURE,
+    }
+    body = orjson.dumps(payload)
+    if compress and _compress_requests and len(body) > GZIP_MIN_SIZE:
+        body = gzip.compress(body, compresslevel=6)
+        headers["Content-Encoding"] = "gzip"
+    return headers, body
+
+
+def _compression_rejected(headers: Dict[str, str], response: httpx.Response) -> bool:
+    """Return whether a compressed request may have failed because it was compressed."""
+    if "Content-Encoding" not in headers:
+        return False
+    if response.status_code == 415:
+        return True
+    return response.status_code == 400 and "maximum context length" not in response.text.lower()
+
+
+def _check_uncompressed_retry(response: httpx.Response) -> None:
+    """Stop compressing requests if the uncompressed resend succeeded."""
+    global _compress_requests
+    if response.is_success and _compress_requests:
+        logging.warning("API rejected gzip-compressed request bodies; sending them uncompressed")
+        _compress_requests = False
+
+
+def _post(client: httpx.Client, prompt: str, api_key: str) -> httpx.Response:
+    """Send a chat completion request, resending it uncompressed if need be."""
+    headers, body = _build_request(prompt, api_key)
+    response = client.post(API_URL, content=body, headers=headers)
+    if _compression_rejected(headers, response):
+        headers, body = _build_request(prompt, api_key, compress=False)
+        response = client.post(API_URL, content=body, headers=headers)
+        _check_uncompressed_retry(response)
+    return response
+
+
+async def _post_async(client: httpx.AsyncClient, prompt: str, api_key: str) -> httpx.Response:
+    """Asynchronous counterpart of `_post`."""
+    headers, body = _build_request(prompt, api_key)
+    response = await client.post(API_URL, content=body, headers=headers)
+    if _compression_rejected(headers, response):
+        headers, body = _build_request(prompt, api_key, compress=False)
+        response = await client.post(API_URL, content=body, headers=headers)
+        _check_uncompressed_retry(response)
+    return response
+
+
+def _cache_key_for(prompt: str, use_cache: bool) -> Optional[str]:
+    """Return the response cache key for ``prompt`` or ``None`` if caching does not apply."""
+    if not use_cache or TEMPERATURE > CACHE_MAX_TEMPERATURE:
+        return None
+    return LLMCache.make_key(MODEL, TEMPERATURE, prompt)
 
 
-def call_api(prompt: str, api_key: str) -> str:
+def _cached_response(cache_key: Optional[str]) -> Optional[str]:
+    """Return the cached response under ``cache_key``, if any."""
+    if cache_key is None:
+        return None
+    return _CACHE.get(cache_key)
+
+
+def _store_response(text: str, cache_key: Optional[str]) -> None:
+    """Remember a successful response under ``cache_key``."""
+    if cache_key is None or text == "TOKEN_LIMIT":
+        return
+    _CACHE.set(cache_key, text)
+
+
+def get_cached_response(prompt: str) -> Optional[str]:
+    """Return the cached response for ``prompt``, or ``None``, without sending a request."""
+    return _cached_response(_cache_key_for(prompt, True))
+
+
+def cache_response(prompt: str, text: str) -> None:
+    """Remember ``text`` as the response to ``prompt``.
+
+    This lets callers that obtained the answer to ``prompt`` in some other
+    way, e.g. as one part of a combined request, have later calls with
+    ``prompt`` answered from the cache.
+    """
+    _store_response(text, _cache_key_for(prompt, True))
+
+
+def _parse_response(response: httpx.Response) -> str:
+    """Extract the generated text from a chat completion response."""
+    if response.status_code in {400, 413} and "maximum context length" in response.text.lower():
+        logging.warning("Token limit exceeded for request")
+        return "TOKEN_LIMIT"
+    if response.status_code in (401, 403):
+        raise PermissionError(f"API key rejected (HTTP {response.status_code})")
+    response.raise_for_status()
+    try:
+        data = orjson.loads(response.content)
+        return data["choices"][0]["message"]["content"].strip()
+    except (KeyError, IndexError) as exc:
+        logging.error("Unexpected API response format: %s", exc)
+        raise RuntimeError("Malformed API response") from exc
+
+
+def call_api(prompt: str, api_key: str, use_cache: bool = True) -> str:
     """Send a prompt to the AI analysis API and return its response.
 
     The implementation targets the OpenAI Chat Completions endpoint but
@@ -65,41 +459,283 @@ def call_api(prompt: str, api_key: str) -> str:
         The constructed prompt to send to the AI service.
     api_key: str
         The API key to use for authentication.
+    use_cache: bool
+        Whether a previously cached response for the same prompt may be
+        returned instead of contacting the service.
 
     Returns
     -------
     str
-        The AI's response as plain text. If the service reports that the
-        request exceeded the token limit, the string ``"TOKEN_LIMIT"`` is
-        returned so the caller can react accordingly.
+        The AI's response as plain text. If the prompt exceeds the token
+        limit, either by local count (see `exceeds_context`) or as
+        reported by the service, the string ``"TOKEN_LIMIT"`` is returned
+        so the caller can react accordingly.
     """
 
     logging.debug("call_api invoked with key %s", api_key)
+    httpx = _get_httpx()
 
-    url = "https://api.openai.com/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-    }
-    payload = {
-        "model": "gpt-3.5-turbo",
-        "messages": [{"role": "user", "content": prompt}],
-        "temperature": 0.2,
-    }
+    cache_key = _cache_key_for(prompt, use_cache)
+    cached = _cached_response(cache_key)
+    if cached is not None:
+        return cached
+    if exceeds_context(prompt):
+        logging.warning("Prompt exceeds the model's context window; not sending it")
+        return "TOKEN_LIMIT"
 
     try:
-        response = requests.post(url, json=payload, headers=headers, timeout=60)
-        if response.status_code in {400, 413} and "maximum context length" in response.text.lower():
-            logging.warning("Token limit exceeded for request")
-            return "TOKEN_LIMIT"
-        if response.status_code == 401:
-            raise PermissionError("Invalid API key")
-        response.raise_for_status()
-        data = response.json()
-        return data["choices"][0]["message"]["content"].strip()
-    except requests.exceptions.RequestException as exc:
+        response = _post(get_client(), prompt, api_key)
+        text = _parse_response(response)
+    except httpx.HTTPError as exc:
         logging.error("API request failed: %s", exc)
         raise
-    except (KeyError, IndexError) as exc:
-        logging.error("Unexpected API response format: %s", exc)
-        raise RuntimeError("Malformed API response") from exc
+    _store_response(text, cache_key)
+    return text
+
+
+async def call_api_async(
+    prompt: str,
+    api_key: str,
+    client: Optional[httpx.AsyncClient] = None,
+    use_cache: bool = True,
+) -> str:
+    """Asynchronous counterpart of :func:`call_api`.
+
+    Several prompts can be awaited together (e.g. with
+    ``asyncio.gather``) and will be multiplexed over a single HTTP/2
+    connection when they share ``client``. If no client is given, a
+    temporary one is created for this call only.
+    """
+
+    logging.debug("call_api_async invoked with key %s", api_key)
+    httpx = _get_httpx()
+
+    cache_key = _cache_key_for(prompt, use_cache)
+    cached = _cached_response(cache_key)
+    if cached is not None:
+        return cached
+    # Counting tokens may first download the encoding, which must not
+    # block the event loop and with it every other request.
+    if await asyncio.get_running_loop().run_in_executor(None, exceeds_context, prompt):
+        logging.warning("Prompt exceeds the model's context window; not sending it")
+        return "TOKEN_LIMIT"
+
+    try:
+        if client is None:
+            async with async_client() as temp_client:
+                response = await _post_async(temp_client, prompt, api_key)
+        else:
+            response = await _post_async(client, prompt, api_key)
+        text = _parse_response(response)
+    except httpx.HTTPError as exc:
+        logging.error("API request failed: %s", exc)
+        raise
+    _store_response(text, cache_key)
+    return text
+
+
+def _is_retryable(exc: httpx.HTTPError) -> bool:
+    """Return whether a failed request may succeed when sent again."""
+    httpx = _get_httpx()
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code in RETRYABLE_STATUS_CODES
+    # Timeouts and connection failures
+    return isinstance(exc, httpx.TransportError)
+
+
+def _is_rate_limit(exc: httpx.HTTPError) -> bool:
+    """Return whether ``exc`` is a rate limit response, the only retryable failure tied to a key."""
+    httpx = _get_httpx()
+    return isinstance(exc, httpx.HTTPStatusError) and exc.response.status_code == 429
+
+
+def _retry_delay(exc: httpx.HTTPError, attempt: int) -> float:
+    """Return the number of seconds to wait before retry number ``attempt``.
+
+    A ``Retry-After`` header sent by the service is honoured; otherwise
+    the delay grows exponentially. Both are capped at `MAX_BACKOFF`.
+    """
+    httpx = _get_httpx()
+    if isinstance(exc, httpx.HTTPStatusError):
+        retry_after = exc.response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return min(float(retry_after), MAX_BACKOFF)
+            except ValueError:
+                pass
+    return min(2 ** (attempt - 1), MAX_BACKOFF)
+
+
+def _retry_after_failure(
+    exc: httpx.HTTPError, api_key: str, sent_at: float, api_manager: ApiManager, attempt: int, max_attempts: int
+) -> Optional[float]:
+    """Update ``api_manager`` after failed attempt number ``attempt`` with ``api_key``.
+
+    ``sent_at`` is the `time.monotonic` time the attempt was sent.
+    Returns the number of seconds to back off before the next attempt, or
+    ``None`` if the error should be raised instead. After a rate limit
+    this is 0: the key is put in a cooldown instead, which the next
+    attempt waits for only if every key is cooling down. Shared by the
+    synchronous and asynchronous retry loops.
+    """
+    if not _is_retryable(exc):
+        return None
+    rate_limited = _is_rate_limit(exc)
+    if rate_limited:
+        api_manager.record_failure(api_key, sent_at)
+    if attempt >= max_attempts:
+        return None
+    if rate_limited:
+        # Only this key is throttled: rest it and carry on with the others
+        cooldown = _retry_delay(exc, attempt)
+        api_manager.cool_down(api_key, cooldown)
+        logging.warning("API key rate limited (%s); resting it for %.1f s", exc, cooldown)
+        return 0.0
+    # Server and network errors affect every key alike, so back off
+    delay = _retry_delay(exc, attempt)
+    logging.warning("API request failed (%s); retrying in %.1f s with the next key", exc, delay)
+    return delay
+
+
+def _reject_key(api_key: str, api_manager: ApiManager) -> None:
+    """Disable a key the service refused to authenticate."""
+    logging.warning("API key rejected; switching to the next key")
+    api_manager.disable_key(api_key)
+
+
+def call_with_key_rotation(send: Callable[[str], T], api_manager: ApiManager, max_attempts: int = 5) -> T:
+    """Call ``send(api_key)``, retrying transient failures with other keys.
+
+    Each attempt passes the next active key of ``api_manager`` to
+    ``send``, which should raise :class:`PermissionError` for a rejected
+    key and :class:`httpx.HTTPError` for other failures. Rate limits (HTTP
+    429), server errors and network failures are retried up to
+    ``max_attempts`` times in total, each time with the next key. After a
+    rate limit the key is put in a cooldown that grows exponentially (or
+    follows ``Retry-After``) and the retry goes to another key straight
+    away. Every attempt, the first included, waits first if all keys are
+    cooling down, rather than sending to a throttled key. Server and
+    network errors are not specific to a key, so the call itself backs
+    off exponentially before retrying. A key that keeps hitting its rate
+    limit is disabled through `ApiManager.record_failure`, where the
+    responses to requests already in flight when the key was throttled
+    count only once; server and network errors never disable a key. A key rejected as invalid (HTTP 401 or
+    403) is disabled immediately and the request is sent again with the
+    next key without waiting. Other errors, including client errors such
+    as HTTP 400 that another key would not fix, are raised at once.
+
+    Raises
+    ------
+    RuntimeError
+        If no active keys remain.
+    httpx.HTTPError
+        If the request failed permanently or ``max_attempts`` was reached.
+    """
+    httpx = _get_httpx()
+    attempt = 0
+    while True:
+        # Every key may be resting after a rate limit, even on the first attempt
+        wait = api_manager.wait_time()
+        if wait:
+            time.sleep(wait)
+        key = api_manager.next_key()
+        if key is None:
+            raise RuntimeError("No active API keys remain")
+        sent_at = time.monotonic()
+        try:
+            result = send(key)
+        except PermissionError:
+            _reject_key(key, api_manager)
+            continue
+        except httpx.HTTPError as exc:
+            attempt += 1
+            delay = _retry_after_failure(exc, key, sent_at, api_manager, attempt, max_attempts)
+            if delay is None:
+                raise
+            if delay:
+                time.sleep(delay)
+            continue
+        api_manager.record_success(key)
+        return result
+
+
+def call_api_with_retry(prompt: str, api_manager: ApiManager, max_attempts: int = 5, use_cache: bool = True) -> str:
+    """Call :func:`call_api`, retrying failures as in `call_with_key_rotation`."""
+    return call_with_key_rotation(lambda key: call_api(prompt, key, use_cache=use_cache), api_manager, max_attempts)
+
+
+async def call_api_with_retry_async(
+    prompt: str,
+    api_manager: ApiManager,
+    client: httpx.AsyncClient,
+    max_attempts: int = 5,
+    use_cache: bool = True,
+) -> str:
+    """Asynchronous counterpart of :func:`call_api_with_retry`."""
+    httpx = _get_httpx()
+    attempt = 0
+    while True:
+        # Every key may be resting after a rate limit, even on the first attempt
+        wait = api_manager.wait_time()
+        if wait:
+            await asyncio.sleep(wait)
+        key = api_manager.next_key()
+        if key is None:
+            raise RuntimeError("No active API keys remain")
+        sent_at = time.monotonic()
+        try:
+            text = await call_api_async(prompt, key, client, use_cache=use_cache)
+        except PermissionError:
+            _reject_key(key, api_manager)
+            continue
+        except httpx.HTTPError as exc:
+            attempt += 1
+            delay = _retry_after_failure(exc, key, sent_at, api_manager, attempt, max_attempts)
+            if delay is None:
+                raise
+            if delay:
+                await asyncio.sleep(delay)
+            continue
+        api_manager.record_success(key)
+        return text
+
+
+async def call_api_batch(prompts: List[str], api_manager: ApiManager, max_concurrency: int = 8) -> List[str]:
+    """Send many prompts concurrently and return their responses in order.
+
+    Prompts are distributed round-robin over the active keys of
+    ``api_manager`` and at most ``max_concurrency`` requests are in
+    flight at once, all sharing one HTTP/2 connection. Failures are
+    retried as described in :func:`call_api_with_retry`.
+
+    Identical prompts are sent only once and their response is shared by
+    every position they occur at; repeats across batches are answered by
+    the response cache.
+
+    Raises
+    ------
+    RuntimeError
+        If every key has been disabled before all prompts completed.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async with async_client() as client:
+
+        async def _one(prompt: str) -> str:
+            async with semaphore:
+                return await call_api_with_retry_async(prompt, api_manager, client)
+
+        # Map each distinct prompt to the positions it occurs at
+        positions: Dict[str, List[int]] = {}
+        for idx, prompt in enumerate(prompts):
+            positions.setdefault(prompt, []).append(idx)
+        if len(positions) < len(prompts):
+            logging.debug("Batch of %d prompts has %d distinct", len(prompts), len(positions))
+
+        responses = await asyncio.gather(*(_one(prompt) for prompt in positions))
+
+    results: List[str] = [""] * len(prompts)
+    for indices, response in zip(positions.values(), responses):
+        for idx in indices:
+            results[idx] = response
+    return results
@@ -0,0 +1,91 @@
+"""Persistent caching of AI responses.
+
+Analysing the same subtitles twice (for example while tuning the system
+instruction on a single lesson) produces the same prompt, and with the
+low sampling temperature used by `call_api` it produces practically the
+same answer too. The `LLMCache` class stores responses on disk keyed by
+a hash of the model, temperature and prompt so that repeated prompts are
+answered locally without a network round trip.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "video_analyzer")
+
+# Responses expire after a week so that model updates eventually show up.
+DEFAULT_TTL = 7 * 24 * 60 * 60
+
+
+class LLMCache:
+    """Disk-backed cache mapping prompt hashes to AI responses.
+
+    Entries are stored in an SQLite database together with their expiry
+    time. One connection is opened on first use and shared between
+    threads under a lock, so a single instance can serve concurrent
+    workers. Failures to read or write the cache are logged and otherwise
+    ignored; the cache never prevents a request from being sent.
+    """
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = path or os.path.join(CACHE_DIR, "responses.db")
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "hash TEXT PRIMARY KEY, response TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def make_key(model: str, temperature: float, prompt: str) -> str:
+        """Return the cache key for a request."""
+        return hashlib.sha256(f"{model}|{temperature}|{prompt}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached value for ``key`` or ``None`` if absent or expired."""
+        with self._lock:
+            try:
+                conn = self._connect()
+                row = conn.execute("SELECT response, expires FROM cache WHERE hash = ?", (key,)).fetchone()
+                if row is not None and row[1] < time.time():
+                    with conn:
+                        conn.execute("DELETE FROM cache WHERE hash = ?", (key,))
+                    row = None
+            except Exception as exc:
+                logging.warning("Failed to read response cache '%s': %s", self.path, exc)
+                row = None
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits"] += 1
+        logging.debug("Response cache hit for %s", key)
+        return row[0]
+
+    def set(self, key: str, value: str, ttl: float = DEFAULT_TTL) -> None:
+        """Store ``value`` under ``key`` for ``ttl`` seconds."""
+        with self._lock:
+            try:
+                conn = self._connect()
+                with conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO cache (hash, response, expires) VALUES (?, ?, ?)",
+                        (key, value, time.time() + ttl),
+                    )
+            except Exception as exc:
+                logging.warning("Failed to write response cache '%s': %s", self.path, exc)
+
@@ -0,0 +1,473 @@
+"""Concurrent analysis of every video in a scanned course.
+
+This module ties the other pieces together: for each video found by
+`scan_course_folder` it loads the subtitle or text content (or a
+transcript of the audio), builds the prompt from the user's system
+instruction and sends it to the AI service. Short videos are packed
+into a single request to save round trips. Requests are processed
+concurrently with :mod:`asyncio`; all of them share one HTTP/2
+connection and rotate through the keys of an `ApiManager`, while the
+blocking file reads and transcriptions run in a small thread pool a few
+videos ahead of the requests.
+
+Results are reported in course order, so callers can write them to the
+study guide as soon as each one is ready.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Tuple, Union
+
+try:  # Support running as a script or module
+    from .api_handler import (
+        MODEL_CONTEXT_TOKENS,
+        MODEL_OUTPUT_TOKENS,
+        ApiManager,
+        async_client,
+        cache_response,
+        call_api_with_retry_async,
+        get_cached_response,
+        prewarm_async,
+    )
+    from .file_processor import read_text_file, transcribe_video
+except ImportError:  # pragma: no cover - fallback for direct execution
+    from api_handler import (
+        MODEL_CONTEXT_TOKENS,
+        MODEL_OUTPUT_TOKENS,
+        ApiManager,
+        async_client,
+        cache_response,
+        call_api_with_retry_async,
+        get_cached_response,
+        prewarm_async,
+    )
+    from file_processor import read_text_file, transcribe_video
+
+CourseStructure = Dict[str, List[Dict[str, Optional[str]]]]
+CourseEntries = Iterable[Tuple[str, Dict[str, Optional[str]]]]
+ResultCallback = Callable[[str, Dict[str, Optional[str]]], None]
+
+# Conservative characters per token: Vietnamese runs at roughly two
+# characters per cl100k token, English at about four.
+_CHARS_PER_TOKEN = 1.5
+# Videos are packed into one request until their combined content reaches
+# this many characters. The prompt must leave room in the context window
+# for the combined answer, which is capped at MODEL_OUTPUT_TOKENS.
+DEFAULT_BATCH_CHARS = int((MODEL_CONTEXT_TOKENS - MODEL_OUTPUT_TOKENS) * _CHARS_PER_TOKEN)
+# The answers for all videos of a request share MODEL_OUTPUT_TOKENS, so
+# only a few videos are packed together to leave each a useful analysis.
+DEFAULT_BATCH_VIDEOS = 4
+# Number of videos whose content is loaded ahead of the requests
+DEFAULT_PREFETCH = 4
+# Analysis of a video for which no subtitle, text or transcript could be
+# obtained; such videos are not sent to the service.
+NO_CONTENT = "NO_CONTENT"
+# How often, in seconds, a cancel event set by another thread is checked
+_CANCEL_POLL_INTERVAL = 0.2
+_ANALYSIS_HEADER = re.compile(r"^[ \t]*=== ANALYSIS (\d+) ===[ \t]*$", re.MULTILINE)
+
+
+def _no_log(message: str) -> None:
+    pass
+
+
+def prompt_builder(system_instruction: str, extra_prompt: str = "") -> Callable[[str], str]:
+    """Return a function composing the prompt for a video from its content.
+
+    The parts shared by every video are prepared once, so each prompt
+    costs a single concatenation. The result equals `build_prompt`.
+    """
+    prefix = f"{system_instruction}\n\nNội dung video:\n".lstrip()
+    suffix = f"\n\n{extra_prompt}" if extra_prompt else ""
+
+    def build(content: str) -> str:
+        content = content.rstrip()
+        if not content:
+            return prefix.rstrip() + suffix
+        return prefix + content + suffix
+
+    return build
+
+
+def build_prompt(system_instruction: str, content: str, extra_prompt: str = "") -> str:
+    """Compose the prompt sent to the AI service for one video."""
+    prompt = f"{system_instruction}\n\nNội dung video:\n{content}".strip()
+    if extra_prompt:
+        prompt += f"\n\n{extra_prompt}"
+    return prompt
+
+
+def load_video_content(
+    entry: Dict[str, Optional[str]],
+    api_manager: ApiManager,
+    log: Callable[[str], None] = _no_log,
+) -> str:
+    """Return the text content of a video record.
+
+    The subtitle and text files are read if present; otherwise the audio
+    is transcribed with the keys of ``api_manager``, retrying transient
+    failures with other keys. An empty string is returned if no content
+    could be obtained.
+    """
+    video_path = entry["video"]
+    subtitle_path = entry["subtitle"]
+    text_path = entry["text"]
+
+    content_parts: List[str] = []
+    if subtitle_path:
+        content_parts.append(read_text_file(subtitle_path))
+    if text_path and text_path != subtitle_path:
+        content_parts.append(read_text_file(text_path))
+    if not content_parts:
+        transcript = transcribe_video(video_path, api_manager)
+        if transcript:
+            content_parts.append(transcript)
+        else:
+            log(f"Không thể trích xuất âm thanh cho video: {video_path}")
+    return "\n".join(content_parts)
+
+
+def build_batch_prompt(system_instruction: str, videos: List[Tuple[str, str]], extra_prompt: str = "") -> str:
+    """Compose one prompt asking for separate analyses of several videos.
+
+    ``videos`` holds ``(name, content)`` pairs. The model is asked to start
+    the answer for video ``i`` with a ``=== ANALYSIS i ===`` line so that
+    `split_batch_response` can recover the individual analyses.
+    """
+    parts = [
+        system_instruction,
+        "",
+        f"Phân tích riêng từng video trong {len(videos)} video dưới đây. "
+        'Bắt đầu phần trả lời cho video thứ i bằng một dòng "=== ANALYSIS i ===".',
+    ]
+    for i, (name, content) in enumerate(videos, start=1):
+        parts.append(f"\n=== VIDEO {i}: {name} ===\n{content}")
+    prompt = "\n".join(parts).strip()
+    if extra_prompt:
+        prompt += f"\n\n{extra_prompt}"
+    return prompt
+
+
+def split_batch_response(response: str, count: int) -> Optional[List[str]]:
+    """Split the answer to a `build_batch_prompt` prompt into ``count`` analyses.
+
+    Returns ``None`` if the response does not contain exactly one section
+    for each video.
+    """
+    sections = _ANALYSIS_HEADER.split(response)
+    # split() yields the text before the first header followed by
+    # alternating (number, body) pairs.
+    numbers = [int(n) for n in sections[1::2]]
+    if numbers != list(range(1, count + 1)):
+        return None
+    return [body.strip() for body in sections[2::2]]
+
+
+async def analyze_course_async(
+    course_structure: Union[CourseStructure, CourseEntries],
+    system_instruction: str,
+    extra_prompt: str,
+    api_manager: ApiManager,
+    concurrency: int = 8,
+    max_batch_chars: int = DEFAULT_BATCH_CHARS,
+    max_batch_videos: int = DEFAULT_BATCH_VIDEOS,
+    use_cache: bool = True,
+    prefetch: int = DEFAULT_PREFETCH,
+    on_result: Optional[ResultCallback] = None,
+    log: Callable[[str], None] = _no_log,
+    cancel_event: Optional[threading.Event] = None,
+) -> CourseStructure:
+    """Analyse every video of ``course_structure`` concurrently.
+
+    Consecutive videos are packed into a single request until their
+    combined content, together with the instructions, would exceed
+    ``max_batch_chars`` characters or the request holds
+    ``max_batch_videos`` videos. This cuts the number of round trips; a
+    video that is larger on its own is
+    sent by itself. If the answer to a packed request cannot be split
+    into one analysis per video, or the request is too long, its videos
+    are sent again one by one.
+
+    Unless ``use_cache`` is false, a video whose prompt was answered
+    before (alone or as part of a combined request) takes its analysis
+    from the response cache and is not sent at all. Videos whose content
+    is identical to an earlier video of the same run (e.g. re-uploads)
+    share that video's result.
+
+    The course may also be given as an iterable of ``(folder_name,
+    record)`` pairs such as `iter_course_folder` produces. It is consumed
+    lazily, so the first videos are analysed while later folders are
+    still being listed.
+
+    The analysis ends early, leaving the remaining videos out of the
+    result, once every key of ``api_manager`` has been disabled.
+
+    At most ``concurrency`` requests are in flight at once. The content
+    of the next ``prefetch`` videos is read (or transcribed) in a thread
+    pool while those requests run, so disk access overlaps with the
+    network without loading the whole course into memory. API calls are
+    retried with other keys as described in `call_api_with_retry_async`.
+
+    Parameters
+    ----------
+    course_structure: dict or iterable
+        Mapping of folder names to video records as returned by
+        `scan_course_folder`, or ``(folder_name, record)`` pairs in
+        course order as yielded by `iter_course_folder`.
+    system_instruction: str
+        Instructions describing how the AI should analyse each video.
+    extra_prompt: str
+        Optional text appended to every prompt.
+    api_manager: ApiManager
+        Source of the API keys used for all requests.
+    concurrency: int
+        Maximum number of requests in flight at the same time.
+    max_batch_chars: int
+        Prompt size up to which videos are combined into one request.
+        ``0`` sends every video separately.
+    max_batch_videos: int
+        Maximum number of videos combined into one request.
+    use_cache: bool
+        Whether cached analyses may be reused.
+    prefetch: int
+        Number of videos loaded ahead of the ones being analysed.
+    on_result: callable, optional
+        Called with the folder name and result record of each video, in
+        course order, as soon as that video and all videos before it are
+        done.
+    log: callable, optional
+        Receives human-readable progress messages.
+    cancel_event: threading.Event, optional
+        May be set from another thread to stop the analysis. Requests in
+        flight are aborted, no further videos are started, and the
+        results delivered so far are returned.
+
+    Returns
+    -------
+    dict
+        Mapping of folder names to result records. Each record contains
+        the ``'video'`` path, its ``'basename'`` and either the
+        ``'analysis'`` text (which is ``"TOKEN_LIMIT"`` if the prompt was
+        too long, or `NO_CONTENT` if the video had no content to send) or
+        an ``'error'`` message.
+    """
+    loop = asyncio.get_running_loop()
+    prefetch = max(prefetch, 1)
+    make_prompt = prompt_builder(system_instruction, extra_prompt)
+    # The instructions are repeated in every request, content fills the rest
+    batch_budget = max_batch_chars - len(system_instruction) - len(extra_prompt)
+    call_semaphore = asyncio.Semaphore(concurrency)
+    if isinstance(course_structure, dict):
+        entries = iter([
+            (folder_name, entry) for folder_name, videos in course_structure.items() for entry in videos
+        ])
+    else:
+        entries = iter(course_structure)
+    # Filled in as entries are discovered; `order` tells the delivery loop
+    # which video comes next, with None marking the end of the course.
+    folders: List[str] = []
+    records: List[Dict[str, Optional[str]]] = []
+    done: List[asyncio.Future] = []
+    order: "asyncio.Queue[Optional[int]]" = asyncio.Queue()
+
+    reader = ThreadPoolExecutor(max_workers=prefetch)
+    try:
+        async with async_client() as client:
+            # Open the connection while the first videos are being loaded
+            prewarm = asyncio.ensure_future(prewarm_async(client))
+
+            def _load(entry: Dict[str, Optional[str]]) -> "asyncio.Future[str]":
+                return loop.run_in_executor(reader, load_video_content, entry, api_manager, log)
+
+            async def _discover() -> bool:
+                # Listing a folder may block, so the next entry is fetched
+                # in the default executor.
+                item = await loop.run_in_executor(None, next, entries, None)
+                if item is None:
+                    return False
+                folder_name, entry = item
+                index = len(records)
+                folders.append(folder_name)
+                basename = entry.get("basename") or os.path.basename(entry["video"])
+                records.append({"video": entry["video"], "basename": basename, "analysis": None, "error": None})
+                done.append(loop.create_future())
+                load_tasks.append(_load(entry))
+                loading.append(index)
+                order.put_nowait(index)
+                return True
+
+            async def _analyze_single(i: int, content: str) -> None:
+                prompt = make_prompt(content)
+                try:
+                    records[i]["analysis"] = await call_api_with_retry_async(
+                        prompt, api_manager, client, use_cache=use_cache
+                    )
+                except Exception as exc:
+                    records[i]["error"] = str(exc)
+
+            async def _analyze_batch(batch: List[Tuple[int, str]]) -> None:
+                # The caller has acquired a slot of call_semaphore for us
+                try:
+                    for i, _ in batch:
+                        log(f"Phân tích video: {records[i]['basename']}")
+                    analyses: Optional[List[str]] = None
+                    if len(batch) > 1:
+                        videos = [(records[i]["basename"], content) for i, content in batch]
+                        prompt = build_batch_prompt(system_instruction, videos, extra_prompt)
+                        try:
+                            response = await call_api_with_retry_async(
+                                prompt, api_manager, client, use_cache=use_cache
+                            )
+                        except Exception as exc:
+                            for i, _ in batch:
+                                records[i]["error"] = str(exc)
+                            return
+                        if response != "TOKEN_LIMIT":
+                            analyses = split_batch_response(response, len(batch))
+                    if analyses is None:
+                        for i, content in batch:
+                            await _analyze_single(i, content)
+                    else:
+                        for (i, content), analysis in zip(batch, analyses):
+                            records[i]["analysis"] = analysis
+                            # Cache under the single-video prompt so a later
+                            # run hits it however the videos are grouped.
+                            cache_response(make_prompt(content), analysis)
+                finally:
+                    call_semaphore.release()
+                    for i, _ in batch:
+                        if not done[i].done():
+                            done[i].set_result(records[i])
+
+            load_tasks: List[asyncio.Future] = []
+            loading: Deque[int] = deque()
+            batch_tasks: List[asyncio.Future] = []
+
+            async def _copy_result(i: int, first: int) -> None:
+                source = await done[first]
+                records[i]["analysis"] = source["analysis"]
+                records[i]["error"] = source["error"]
+                if not done[i].done():
+                    done[i].set_result(records[i])
+
+            async def _dispatch(batch: List[Tuple[int, str]]) -> None:
+                # Waiting for a free slot here stops the loads from running
+                # further ahead while all requests are busy.
+                await call_semaphore.acquire()
+                batch_tasks.append(asyncio.ensure_future(_analyze_batch(batch)))
+
+            async def _pack() -> None:
+                # Fill batches in course order and dispatch each as soon as
+                # the next video would not fit.
+                try:
+                    batch: List[Tuple[int, str]] = []
+                    size = 0
+                    more = True
+                    # Content digest -> index of the first video with it
+                    seen: Dict[bytes, int] = {}
+                    while True:
+                        if api_manager.get_active_key() is None:
+                            # Every key has been disabled, so stop reading and
+                            # transcribing; videos already taken up fail.
+                            for j in [*(j for j, _ in batch), *loading]:
+                                load_tasks[j].cancel()
+                                records[j]["error"] = "No active API keys remain"
+                                done[j].set_result(records[j])
+                            batch = []
+                            loading.clear()
+                            break
+                        while more and len(loading) < prefetch:
+                            more = await _discover()
+                        if not loading:
+                            break
+                        i = loading.popleft()
+                        content = await load_tasks[i]
+                        if not content.strip():
+                            records[i]["analysis"] = NO_CONTENT
+                            done[i].set_result(records[i])
+                            continue
+                        digest = hashlib.sha256(content.encode("utf-8")).digest()
+                        first = seen.setdefault(digest, i)
+                        if first != i:
+                            log(
+                                f"Nội dung trùng với video {records[first]['basename']}, "
+                                f"dùng chung kết quả: {records[i]['basename']}"
+                            )
+                            batch_tasks.append(asyncio.ensure_future(_copy_result(i, first)))
+                            continue
+                        if use_cache:
+                            cached = get_cached_response(make_prompt(content))
+                            if cached is not None:
+                                log(f"Dùng kết quả đã lưu cho video: {records[i]['basename']}")
+                                records[i]["analysis"] = cached
+                                done[i].set_result(records[i])
+                                continue
+                        if batch and (size + len(content) > batch_budget or len(batch) >= max_batch_videos):
+                            await _dispatch(batch)
+                            batch, size = [], 0
+                        batch.append((i, content))
+                        size += len(content)
+                    if batch:
+                        await _dispatch(batch)
+                except Exception as exc:
+                    for future in done:
+                        if not future.done():
+                            future.set_exception(exc)
+                    raise
+                finally:
+                    order.put_nowait(None)
+
+            stopped = False
+
+            async def _watch_cancel() -> None:
+                nonlocal stopped
+                assert cancel_event is not None
+                while not cancel_event.is_set():
+                    await asyncio.sleep(_CANCEL_POLL_INTERVAL)
+                stopped = True
+                packer.cancel()
+                for task in [*load_tasks, *batch_tasks]:
+                    task.cancel()
+                for future in done:
+                    future.cancel()
+
+            packer = asyncio.ensure_future(_pack())
+            watcher = asyncio.ensure_future(_watch_cancel()) if cancel_event is not None else None
+            results: CourseStructure = {}
+            try:
+                # Awaiting in course order delivers each result as soon as it
+                # and everything before it has finished.
+                while True:
+                    index = await order.get()
+                    if index is None:
+                        break
+                    try:
+                        record = await done[index]
+                    except asyncio.CancelledError:
+                        if stopped:
+                            break
+                        raise
+                    results.setdefault(folders[index], []).append(record)
+                    if on_result is not None:
+                        on_result(folders[index], record)
+                if not stopped:
+                    await packer
+            finally:
+                pending = [prewarm, packer, *load_tasks, *batch_tasks]
+                if watcher is not None:
+                    pending.append(watcher)
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+    finally:
+        # Do not block the event loop on a transcription that is still running
+        reader.shutdown(wait=False, cancel_futures=True)
+
+    return results
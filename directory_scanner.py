@@ -15,23 +15,51 @@ Usage example:
 {'Lesson 1': [
     {'video': '/path/to/course/Lesson 1/intro.mp4',
      'subtitle': '/path/to/course/Lesson 1/intro.srt',
-     'text': None}
+     'text': None,
+     'basename': 'intro.mp4'}
  ]}
+
+`iter_course_folder` yields the same records one at a time, so callers
+can start working on the first folder while later ones are still being
+listed. Passing ``cache_path`` (e.g. `SCAN_CACHE_PATH`) lets repeated scans of an
+unchanged course reuse the previous result instead of listing every
+folder again.
 """
 
 from __future__ import annotations
 
+import json
+import logging
 import os
-from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:  # Support running as a script or module
+    from .cache import CACHE_DIR
+except ImportError:  # pragma: no cover - fallback for direct execution
+    from cache import CACHE_DIR
+
+SCAN_CACHE_PATH = os.path.join(CACHE_DIR, "scan.json")
+# Stored in the scan cache; bump when the record format changes so that
+# caches written by older versions are ignored.
+_SCAN_CACHE_VERSION = 2
+
+SUBTITLE_EXTENSIONS = (".srt", ".vtt")
+TEXT_EXTENSIONS = (".txt",)
+
+# Directory listings spend most of their time waiting on the disk or the
+# network share, so several folders can be listed at once.
+_SCAN_WORKERS = 16
 
 
-def _find_associated_text_files(folder: str, base_name: str) -> Dict[str, Optional[str]]:
+def _find_associated_text_files(files_by_base: Dict[str, Dict[str, str]], base_name: str) -> Dict[str, Optional[str]]:
     """Return a dictionary mapping keys 'subtitle' and 'text' to matching files.
 
     Parameters
     ----------
-    folder: str
-        The directory in which to search for associated files.
+    files_by_base: dict
+        Index of the folder's files, mapping each lower‑cased base name to
+        a mapping of lower‑cased extension to full path.
     base_name: str
         The filename without extension of the video (e.g. 'lesson1').
 
@@ -42,29 +70,164 @@ def _find_associated_text_files(folder: str, base_name: str) -> Dict[str, Option
         are the full paths to the corresponding files if found, or
         ``None`` otherwise.
     """
-    subtitle_extensions = [".srt", ".vtt"]
-    text_extensions = [".txt"]
+    candidates = files_by_base.get(base_name.lower(), {})
     subtitle_path: Optional[str] = None
     text_path: Optional[str] = None
 
     # Look for subtitle files
-    for ext in subtitle_extensions:
-        candidate = os.path.join(folder, base_name + ext)
-        if os.path.isfile(candidate):
-            subtitle_path = candidate
+    for ext in SUBTITLE_EXTENSIONS:
+        if ext in candidates:
+            subtitle_path = candidates[ext]
             break
 
     # Look for text file if not already set; note .txt takes precedence
-    for ext in text_extensions:
-        candidate = os.path.join(folder, base_name + ext)
-        if os.path.isfile(candidate):
-            text_path = candidate
+    for ext in TEXT_EXTENSIONS:
+        if ext in candidates:
+            text_path = candidates[ext]
             break
 
     return {"subtitle": subtitle_path, "text": text_path}
 
 
-def scan_course_folder(root_path: str) -> Dict[str, List[Dict[str, Optional[str]]]]:
+def _scan_subdir(subdir_path: str) -> List[Dict[str, Optional[str]]]:
+    """Return the video records found in ``subdir_path``."""
+    # Index the folder's files by base name in a single pass
+    files_by_base: Dict[str, Dict[str, str]] = {}
+    video_files: List[os.DirEntry] = []
+    with os.scandir(subdir_path) as it:
+        for file_entry in it:
+            if not file_entry.is_file():
+                continue
+            base, ext = os.path.splitext(file_entry.name)
+            ext = ext.lower()
+            files_by_base.setdefault(base.lower(), {})[ext] = file_entry.path
+            if ext == ".mp4":
+                video_files.append(file_entry)
+
+    # Gather video files within this subdirectory
+    videos: List[Dict[str, Optional[str]]] = []
+    for file_entry in sorted(video_files, key=lambda e: e.name):
+        base_name = os.path.splitext(file_entry.name)[0]
+        associated = _find_associated_text_files(files_by_base, base_name)
+        videos.append({
+            "video": file_entry.path,
+            "subtitle": associated["subtitle"],
+            "text": associated["text"],
+            "basename": file_entry.name,
+        })
+    return videos
+
+
+def _dir_signature(path: str) -> List[int]:
+    """Return values that change whenever entries are added to or removed from ``path``."""
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+def _scan_subdir_cached(
+    subdir_path: str, cached: Optional[Dict[str, Any]]
+) -> Tuple[List[int], List[Dict[str, Optional[str]]]]:
+    """Return the signature and video records of ``subdir_path``, reusing ``cached`` if still valid."""
+    # Take the signature before listing so that changes made during the
+    # scan invalidate the stored result next time.
+    signature = _dir_signature(subdir_path)
+    if cached is not None and cached.get("signature") == signature:
+        return signature, cached["videos"]
+    return signature, _scan_subdir(subdir_path)
+
+
+def _load_scan_cache(cache_path: str) -> Dict[str, Any]:
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as exc:
+        logging.warning("Ignoring unreadable scan cache '%s': %s", cache_path, exc)
+        return {}
+    # Entries are keyed by absolute root path, so "version" cannot clash
+    if cache.get("version") != _SCAN_CACHE_VERSION:
+        return {}
+    return cache
+
+
+def _save_scan_cache(cache_path: str, cache: Dict[str, Any]) -> None:
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        cache["version"] = _SCAN_CACHE_VERSION
+        tmp_path = cache_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(cache, f, ensure_ascii=False)
+        os.replace(tmp_path, cache_path)
+    except Exception as exc:
+        logging.warning("Failed to write scan cache '%s': %s", cache_path, exc)
+
+
+def iter_course_folder(
+    root_path: str, cache_path: Optional[str] = None
+) -> Iterator[Tuple[str, Dict[str, Optional[str]]]]:
+    """Yield ``(folder_name, record)`` pairs for every video of a course.
+
+    This is the streaming form of `scan_course_folder`: the records are
+    the same and come in the same order, but each folder's videos are
+    yielded as soon as that folder has been listed. Folders without
+    videos yield nothing. The scan cache, if any, is updated once the
+    iterator is exhausted.
+
+    Parameters
+    ----------
+    root_path: str
+        The full path to the root course folder chosen by the user.
+    cache_path: str, optional
+        JSON file in which scan results are remembered between calls, as
+        for `scan_course_folder`.
+
+    Raises
+    ------
+    FileNotFoundError
+        If ``root_path`` is not a directory. This is checked immediately,
+        not when iteration starts.
+    """
+    if not os.path.isdir(root_path):
+        raise FileNotFoundError(f"The provided path '{root_path}' is not a directory")
+    return _iter_course_folder(root_path, cache_path)
+
+
+def _iter_course_folder(
+    root_path: str, cache_path: Optional[str]
+) -> Iterator[Tuple[str, Dict[str, Optional[str]]]]:
+    cache = _load_scan_cache(cache_path) if cache_path else {}
+    root_key = os.path.abspath(root_path)
+    cached_root = cache.get(root_key) or {}
+    cached_subdirs: Dict[str, Any] = cached_root.get("subdirs", {})
+
+    # Iterate over the immediate children of the root directory, unless
+    # the set of children is known not to have changed
+    root_signature = _dir_signature(root_path)
+    if cached_root.get("signature") == root_signature:
+        subdir_names = list(cached_subdirs)
+    else:
+        with os.scandir(root_path) as it:
+            subdir_names = sorted(e.name for e in it if e.is_dir())
+
+    subdir_paths = [os.path.join(root_path, name) for name in subdir_names]
+    new_subdirs: Dict[str, Any] = {}
+    with ThreadPoolExecutor(max_workers=_SCAN_WORKERS) as executor:
+        # map() yields results in order as they become available
+        results = executor.map(
+            _scan_subdir_cached, subdir_paths, [cached_subdirs.get(name) for name in subdir_names]
+        )
+        for name, (signature, videos) in zip(subdir_names, results):
+            new_subdirs[name] = {"signature": signature, "videos": videos}
+            for record in videos:
+                yield name, record
+
+    if cache_path:
+        cache[root_key] = {"signature": root_signature, "subdirs": new_subdirs}
+        _save_scan_cache(cache_path, cache)
+
+
+def scan_course_folder(root_path: str, cache_path: Optional[str] = None) -> Dict[str, List[Dict[str, Optional[str]]]]:
     """Recursively scan a course directory to map videos to their associated files.
 
     Given a root directory, this function walks through all first-level
@@ -76,40 +239,30 @@ def scan_course_folder(root_path: str) -> Dict[str, List[Dict[str, Optional[str]
     subdirectory name. Each value is a list of dictionaries containing
     absolute paths for the video and its associated files.
 
+    Each directory is listed once with :func:`os.scandir`, whose entries
+    carry the file type from the directory listing itself, so no extra
+    ``stat`` call is needed per file. Subdirectories are listed
+    concurrently on a small thread pool.
+
     Parameters
     ----------
     root_path: str
         The full path to the root course folder chosen by the user.
+    cache_path: str, optional
+        JSON file in which scan results are remembered between calls.
+        Each directory's modification time and size are stored with its
+        result, and a directory is only listed again when they change, so
+        editing one lesson folder rescans just that folder. If omitted,
+        every directory is listed.
 
     Returns
     -------
     dict
         A nested mapping from folder names to lists of file records. Each
         record dictionary contains keys ``'video'``, ``'subtitle'``, and
-        ``'text'``.
+        ``'text'``, plus the video's file name under ``'basename'``.
     """
     course_structure: Dict[str, List[Dict[str, Optional[str]]]] = {}
-
-    if not os.path.isdir(root_path):
-        raise FileNotFoundError(f"The provided path '{root_path}' is not a directory")
-
-    # Iterate over the immediate children of the root directory
-    for entry in sorted(os.listdir(root_path)):
-        subdir_path = os.path.join(root_path, entry)
-        if os.path.isdir(subdir_path):
-            # Gather video files within this subdirectory
-            videos: List[Dict[str, Optional[str]]] = []
-            for filename in sorted(os.listdir(subdir_path)):
-                if filename.lower().endswith(".mp4"):
-                    base_name = os.path.splitext(filename)[0]
-                    video_path = os.path.join(subdir_path, filename)
-                    associated = _find_associated_text_files(subdir_path, base_name)
-                    videos.append({
-                        "video": video_path,
-                        "subtitle": associated["subtitle"],
-                        "text": associated["text"],
-                    })
-            if videos:
-                course_structure[entry] = videos
-
+    for folder_name, record in iter_course_folder(root_path, cache_path):
+        course_structure.setdefault(folder_name, []).append(record)
     return course_structure
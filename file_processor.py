@@ -10,15 +10,73 @@ obtain a transcript.
 from __future__ import annotations
 
 import logging
+import mmap
 import os
+import shutil
+import subprocess
 import tempfile
-
-import requests  # type: ignore
+from typing import Callable, Iterable, Optional
+
+import orjson
+
+try:  # RE2 matches in linear time without backtracking
+    import re2 as re  # type: ignore
+except ImportError:
+    import re
+
+try:  # Support running as a script or module
+    from .api_handler import ApiManager, call_with_key_rotation, get_client
+    from .directory_scanner import SUBTITLE_EXTENSIONS
+except ImportError:  # pragma: no cover - fallback for direct execution
+    from api_handler import ApiManager, call_with_key_rotation, get_client
+    from directory_scanner import SUBTITLE_EXTENSIONS
+
+# Subtitle lines that carry no dialogue: the WebVTT header, cue numbers
+# and cue timings. They only add tokens to the prompt. Timing lines in
+# either format contain "-->", which is checked as a plain substring
+# first; the pattern catches the rest. A line of digits is only a cue
+# number when a timing line follows it, otherwise it is dialogue.
+_SUBTITLE_META = re.compile(r"^WEBVTT|^\d\d:\d\d:\d\d")
+_CUE_INDEX = re.compile(r"^\d+$")
+
+# Files above this size are memory-mapped rather than read into a buffer;
+# for small subtitle files the mapping overhead is not worth it.
+_MMAP_THRESHOLD = 1 << 20
+
+
+def _filter_subtitle_lines(lines: Iterable[str]) -> str:
+    """Join the dialogue lines of a subtitle file, dropping cue metadata."""
+    kept = []
+    # Digits-only line whose role depends on the next non-blank line
+    cue_index: Optional[str] = None
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if "-->" in line:
+            cue_index = None
+            continue
+        if cue_index is not None:
+            kept.append(cue_index)
+            cue_index = None
+        if _CUE_INDEX.match(line):
+            cue_index = line
+        elif not _SUBTITLE_META.match(line):
+            kept.append(line)
+    if cue_index is not None:
+        kept.append(cue_index)
+    return "\n".join(kept)
 
 
 def read_text_file(file_path: str) -> str:
     """Read and return the contents of a subtitle or text file.
 
+    Subtitle files (``.srt`` and ``.vtt``) are read line by line and only
+    their dialogue lines are kept; cue numbers, timings and blank
+    separators are dropped so they do not end up in the prompt. Files
+    larger than 1 MiB are memory-mapped and decoded directly from the
+    mapping, so no intermediate copy of the raw bytes is made.
+
     Parameters
     ----------
     file_path: str
@@ -27,12 +85,23 @@ def read_text_file(file_path: str) -> str:
     Returns
     -------
     str
-        The file's contents as a UTF‑8 string. If reading fails, an
-        empty string is returned and an error is logged.
+        The file's contents as a UTF‑8 string, with undecodable bytes
+        replaced. If reading fails, an empty string is returned and an
+        error is logged.
     """
+    is_subtitle = os.path.splitext(file_path)[1].lower() in SUBTITLE_EXTENSIONS
     try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            content = f.read()
+        if os.path.getsize(file_path) > _MMAP_THRESHOLD:
+            with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if is_subtitle:
+                    content = _filter_subtitle_lines(
+                        line.decode("utf-8-sig", "replace") for line in iter(mm.readline, b"")
+                    )
+                else:
+                    content = str(mm, "utf-8-sig", "replace")
+        else:
+            with open(file_path, "r", encoding="utf-8-sig", errors="replace", buffering=1 << 20) as f:
+                content = _filter_subtitle_lines(f) if is_subtitle else f.read()
         logging.debug("Read %d characters from '%s'", len(content), file_path)
         return content
     except Exception as e:
@@ -40,6 +109,96 @@ def read_text_file(file_path: str) -> str:
         return ""
 
 
+def _ffmpeg_executable() -> str:
+    """Return the path of the ffmpeg binary used to extract audio."""
+    executable = shutil.which("ffmpeg")
+    if executable:
+        return executable
+    try:
+        # imageio-ffmpeg ships a static build; it is commonly installed
+        # alongside video tooling even when ffmpeg is not on PATH.
+        import imageio_ffmpeg  # type: ignore
+    except ImportError as exc:
+        raise FileNotFoundError("ffmpeg was not found on PATH") from exc
+    return imageio_ffmpeg.get_ffmpeg_exe()
+
+
+def _extract_audio(video_path: str, audio_path: str) -> bool:
+    """Write the first audio track of ``video_path`` to ``audio_path`` as MP3.
+
+    Returns ``False`` if the video has no audio track.
+    """
+    # Speech recognition works on 16 kHz mono audio internally, so a
+    # low-bitrate mono encoding loses nothing and keeps the upload small.
+    proc = subprocess.run(
+        [
+            _ffmpeg_executable(), "-y", "-i", video_path,
+            "-map", "0:a:0", "-vn", "-ac", "1", "-ar", "16000",
+            "-acodec", "libmp3lame", "-b:a", "32k", audio_path,
+        ],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    if proc.returncode != 0:
+        stderr = proc.stderr.decode("utf-8", "replace")
+        if "matches no streams" in stderr:
+            logging.warning("No audio track found in '%s'", video_path)
+            return False
+        raise RuntimeError(f"ffmpeg exited with status {proc.returncode}: {stderr.strip()[-500:]}")
+    return True
+
+
+def _transcribe_audio(audio_path: str, api_key: str) -> str:
+    """Send an audio file to the Whisper API and return the transcript.
+
+    Raises :class:`PermissionError` if the key is rejected and
+    :class:`httpx.HTTPError` for other failed requests.
+    """
+    url = "https://api.openai.com/v1/audio/transcriptions"
+    headers = {"Authorization": f"Bearer {api_key}"}
+    # The open file is streamed as the multipart body, so the audio is
+    # never loaded into memory or base64-encoded.
+    with open(audio_path, "rb") as audio_file:
+        files = {"file": (os.path.basename(audio_path), audio_file, "audio/mpeg")}
+        data = {"model": "whisper-1"}
+        response = get_client().post(url, headers=headers, files=files, data=data, timeout=300)
+
+    if response.status_code in (401, 403):
+        raise PermissionError(f"API key rejected for transcription (HTTP {response.status_code})")
+    response.raise_for_status()
+    result = orjson.loads(response.content).get("text", "")
+    logging.debug("Transcription obtained with length %d", len(result))
+    return result
+
+
+def _transcribe_video(video_path: str, transcribe: Callable[[str], str]) -> str:
+    """Extract the audio of ``video_path`` and pass the audio file to ``transcribe``.
+
+    Errors are logged and yield an empty string.
+    """
+
+    import httpx  # type: ignore  # Local import to avoid loading it when unused
+
+    logging.info("Extracting and transcribing audio for '%s'", video_path)
+    tmp_path: Optional[str] = None
+    try:
+        with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as tmp:
+            tmp_path = tmp.name
+        if not _extract_audio(video_path, tmp_path):
+            return ""
+        return transcribe(tmp_path)
+    except httpx.HTTPError as exc:
+        logging.error("Transcription request failed: %s", exc)
+    except Exception as exc:  # pragma: no cover - broad catch to log unexpected errors
+        logging.error("Audio extraction/transcription failed for '%s': %s", video_path, exc)
+    finally:
+        # Remove the temporary audio file even if extraction or upload failed
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+    return ""
+
+
 def extract_audio_and_transcribe(video_path: str, api_key: str) -> str:
     """Extract audio from a video file and transcribe it using Whisper API.
 
@@ -56,35 +215,34 @@ def extract_audio_and_transcribe(video_path: str, api_key: str) -> str:
         The transcribed text. If an error occurs during extraction or
         transcription, an empty string is returned.
     """
+    return _transcribe_video(video_path, lambda audio_path: _transcribe_audio(audio_path, api_key))
 
-    logging.info("Extracting and transcribing audio for '%s'", video_path)
-    try:
-        from moviepy import VideoFileClip  # Local import to avoid heavy dependency when unused
-
-        with VideoFileClip(video_path) as clip:
-            if clip.audio is None:
-                logging.warning("No audio track found in '%s'", video_path)
-                return ""
-            with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as tmp:
-                tmp_path = tmp.name
-                clip.audio.write_audiofile(tmp_path, logger=None)
-
-        url = "https://api.openai.com/v1/audio/transcriptions"
-        headers = {"Authorization": f"Bearer {api_key}"}
-        with open(tmp_path, "rb") as audio_file:
-            files = {"file": (os.path.basename(tmp_path), audio_file, "audio/mpeg")}
-            data = {"model": "whisper-1"}
-            response = requests.post(url, headers=headers, files=files, data=data, timeout=300)
-        os.unlink(tmp_path)
-
-        if response.status_code == 401:
-            raise PermissionError("Invalid API key for transcription")
-        response.raise_for_status()
-        result = response.json().get("text", "")
-        logging.debug("Transcription obtained with length %d", len(result))
-        return result
-    except requests.exceptions.RequestException as exc:
-        logging.error("Transcription request failed: %s", exc)
-    except Exception as exc:  # pragma: no cover - broad catch to log unexpected errors
-        logging.error("Audio extraction/transcription failed for '%s': %s", video_path, exc)
-    return ""
+
+def transcribe_video(video_path: str, api_manager: ApiManager, max_attempts: int = 3) -> str:
+    """Like `extract_audio_and_transcribe`, but retry the upload with other keys.
+
+    The audio is extracted once. Uploading it is retried as described in
+    `call_with_key_rotation`, so a rate limit or server error on one key
+    does not lose the transcript.
+
+    Parameters
+    ----------
+    video_path: str
+        The full path to the ``.mp4`` file.
+    api_manager: ApiManager
+        Source of the API keys used for the upload.
+    max_attempts: int
+        Maximum number of upload attempts.
+
+    Returns
+    -------
+    str
+        The transcribed text, or an empty string if it could not be
+        obtained.
+    """
+    return _transcribe_video(
+        video_path,
+        lambda audio_path: call_with_key_rotation(
+            lambda key: _transcribe_audio(audio_path, key), api_manager, max_attempts
+        ),
+    )
@@ -11,22 +11,69 @@ take place in a background thread to keep the GUI responsive.
 
 from __future__ import annotations
 
+import asyncio
 import os
+import queue
+import re
 import threading
-from typing import List
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 
 import tkinter as tk
 from tkinter import filedialog, messagebox
 from tkinter import scrolledtext
 
 try:  # Support running as a script or module
-    from .directory_scanner import scan_course_folder
-    from .file_processor import read_text_file, extract_audio_and_transcribe
-    from .api_handler import ApiManager, call_api
+    from .directory_scanner import SCAN_CACHE_PATH, iter_course_folder
+    from .api_handler import ApiManager
+    from .course_analyzer import NO_CONTENT, analyze_course_async
 except ImportError:  # pragma: no cover - fallback for direct execution
-    from directory_scanner import scan_course_folder
-    from file_processor import read_text_file, extract_audio_and_transcribe
-    from api_handler import ApiManager, call_api
+    from directory_scanner import SCAN_CACHE_PATH, iter_course_folder
+    from api_handler import ApiManager
+    from course_analyzer import NO_CONTENT, analyze_course_async
+
+# Number of analyses collected before they are written to the study guide
+WRITE_BATCH = 8
+
+# Section headers of the study guide as written by `process_course`: a
+# folder header is directly followed by a blank line and a video header.
+# Requiring that shape keeps markdown headings inside an analysis from
+# being mistaken for either.
+_GUIDE_HEADER = re.compile(r"^(?:# (?P<folder>.+)\n(?=\n## )|## (?P<video>.+\.mp4)$)", re.MULTILINE | re.IGNORECASE)
+
+
+# First line of a study guide, naming the course it was written for
+_GUIDE_COURSE_LINE = "<!-- course: {} -->\n"
+
+
+def _analysed_videos(output_path: str, course_root: str) -> Optional[Set[Tuple[str, str]]]:
+    """Return the ``(folder_name, basename)`` pairs already in a study guide.
+
+    ``None`` is returned if there is no guide at ``output_path`` or if it
+    was written for a course other than ``course_root``; such a guide is
+    to be replaced rather than resumed.
+    """
+    try:
+        with open(output_path, "r", encoding="utf-8", errors="replace") as f:
+            text = f.read()
+    except FileNotFoundError:
+        return None
+    if not text.startswith(_GUIDE_COURSE_LINE.format(course_root)):
+        return None
+    done: Set[Tuple[str, str]] = set()
+    folder: Optional[str] = None
+    for match in _GUIDE_HEADER.finditer(text):
+        if match.group("folder") is not None:
+            folder = match.group("folder")
+        elif folder is not None:
+            done.add((folder, match.group("video")))
+    return done
+
+
+# Requests kept in flight per API key. Each request spends most of its
+# time waiting for the model, so a key's rate limit is reached only with
+# several requests outstanding. A 429 puts the key in a cooldown; the
+# other 429s of the same burst are not counted towards disabling it.
+REQUESTS_PER_KEY = 4
 
 
 class VideoAnalyzerApp:
@@ -41,12 +88,25 @@ class VideoAnalyzerApp:
         self.course_path = tk.StringVar()
         self.extra_prompt = tk.StringVar()
         self.api_keys_text = tk.StringVar()
+        self.no_cache = tk.BooleanVar(value=False)
+        self.force_rerun = tk.BooleanVar(value=False)
 
-        # Flag to prevent multiple analyses running simultaneously
+        # Flag to prevent multiple analyses running simultaneously; read and
+        # written by both the GUI and the worker thread under _state_lock
         self.analysis_in_progress = False
+        self._state_lock = threading.Lock()
+        # Set by the stop button, watched by the running analysis
+        self._cancel_event = threading.Event()
+
+        # Log messages from worker threads, shown by `_drain_log`. At most
+        # one <<NewLog>> event is outstanding at a time.
+        self._log_queue: "queue.Queue[str]" = queue.Queue()
+        self._log_lock = threading.Lock()
+        self._log_event_pending = False
 
         # Build the UI
         self._build_interface()
+        self.log_text.bind("<<NewLog>>", self._drain_log)
 
     def _build_interface(self) -> None:
         """Constructs the GUI elements."""
@@ -79,6 +139,11 @@ class VideoAnalyzerApp:
         # Start button
         self.start_button = tk.Button(self.master, text="Bắt đầu phân tích", command=self.start_analysis)
         self.start_button.grid(row=row, column=0, pady=10, padx=5, sticky='w')
+        tk.Checkbutton(self.master, text="Không dùng kết quả đã lưu (gọi lại API)", variable=self.no_cache).grid(row=row, column=1, sticky='w', padx=5)
+        self.stop_button = tk.Button(self.master, text="Dừng", command=self.stop_analysis, state='disabled')
+        self.stop_button.grid(row=row, column=2, pady=10, padx=5, sticky='w')
+        row += 1
+        tk.Checkbutton(self.master, text="Phân tích lại cả video đã có trong study_guide.txt", variable=self.force_rerun).grid(row=row, column=1, sticky='w', padx=5)
         row += 1
 
         # Log area
@@ -97,17 +162,49 @@ class VideoAnalyzerApp:
             self.course_path.set(selected)
 
     def _log(self, message: str) -> None:
-        """Append a message to the log text box in a thread‑safe manner."""
-        def append():
+        """Queue a message for the log text box; safe to call from any thread.
+
+        A ``<<NewLog>>`` virtual event wakes the GUI thread, unless one is
+        already waiting to be handled.
+        """
+        self._log_queue.put(message)
+        with self._log_lock:
+            if self._log_event_pending:
+                return
+            self._log_event_pending = True
+        try:
+            self.log_text.event_generate("<<NewLog>>", when="tail")
+        except tk.TclError:
+            # The window has been closed
+            pass
+
+    def _drain_log(self, event: Optional[tk.Event] = None) -> None:
+        """Append all queued log messages in one update.
+
+        Inserting a burst of messages at once keeps the GUI responsive when
+        the worker logs many lines in quick succession.
+        """
+        # Clear the flag before draining so a message queued meanwhile
+        # either gets drained now or triggers a new event.
+        with self._log_lock:
+            self._log_event_pending = False
+        messages: List[str] = []
+        while True:
+            try:
+                messages.append(self._log_queue.get_nowait())
+            except queue.Empty:
+                break
+        if messages:
             self.log_text.configure(state='normal')
-            self.log_text.insert(tk.END, message + "\n")
+            self.log_text.insert(tk.END, "\n".join(messages) + "\n")
             self.log_text.see(tk.END)
             self.log_text.configure(state='disabled')
-        self.master.after(0, append)
 
     def start_analysis(self) -> None:
         """Validate user inputs and start the analysis in a new thread."""
-        if self.analysis_in_progress:
+        with self._state_lock:
+            busy = self.analysis_in_progress
+        if busy:
             messagebox.showinfo("Thông báo", "Đang phân tích, vui lòng chờ hoàn thành trước khi bắt đầu phiên mới.")
             return
 
@@ -116,6 +213,8 @@ class VideoAnalyzerApp:
         extra_prompt = self.extra_prompt.get().strip()
         api_keys_input = self.api_keys_textbox.get("1.0", tk.END).strip()
         api_keys = [key.strip() for key in api_keys_input.splitlines() if key.strip()]
+        use_cache = not self.no_cache.get()
+        force_rerun = self.force_rerun.get()
 
         if not system_instruction:
             messagebox.showwarning("Thiếu thông tin", "Vui lòng nhập System Instruction để mô tả cách AI cần phân tích video.")
@@ -134,36 +233,59 @@ class VideoAnalyzerApp:
 
         # Disable start button while processing
         self.start_button.configure(state='disabled')
-        self.analysis_in_progress = True
+        self.stop_button.configure(state='normal')
+        self._cancel_event.clear()
+        with self._state_lock:
+            self.analysis_in_progress = True
 
         # Start background thread
         thread = threading.Thread(
             target=self.process_course,
-            args=(system_instruction, course_path, extra_prompt, api_keys),
+            args=(system_instruction, course_path, extra_prompt, api_keys, use_cache, force_rerun),
             daemon=True,
         )
         thread.start()
 
-    def process_course(self, system_instruction: str, course_path: str, extra_prompt: str, api_keys: List[str]) -> None:
+    def stop_analysis(self) -> None:
+        """Ask the running analysis to stop as soon as possible."""
+        self._cancel_event.set()
+        self.stop_button.configure(state='disabled')
+        self._log("Đang dừng phân tích...")
+
+    def process_course(
+        self,
+        system_instruction: str,
+        course_path: str,
+        extra_prompt: str,
+        api_keys: List[str],
+        use_cache: bool = True,
+        force_rerun: bool = False,
+    ) -> None:
         """Perform the directory scan and call the AI service for each video.
 
-        This runs in a separate thread to keep the GUI responsive. Results
+        This runs in a separate thread to keep the GUI responsive. Videos
+        are analysed concurrently by `analyze_course_async`. Results
         are written to a `study_guide.txt` file in the same directory
         where this script is executed. Log messages are sent back to the
-        GUI thread using `_log`.
+        GUI thread using `_log`. Unless ``use_cache`` is false, videos
+        analysed in an earlier run with unchanged content and instructions
+        are taken from the response cache.
+
+        Unless ``force_rerun`` is true, videos that already have a section
+        in an existing `study_guide.txt` of the same course are skipped and
+        new results are appended, so an interrupted run resumes where it
+        stopped. A guide written for another course is replaced.
         """
         try:
             self._log(f"Bắt đầu quét thư mục: {course_path}")
             try:
-                course_structure = scan_course_folder(course_path)
+                # Folders are listed while the first videos are analysed;
+                # the previous scan is reused for folders that have not changed
+                course_entries = iter_course_folder(course_path, cache_path=SCAN_CACHE_PATH)
             except Exception as e:
                 self._log(f"Lỗi khi quét thư mục: {e}")
                 return
 
-            if not course_structure:
-                self._log("Không tìm thấy video nào trong thư mục đã chọn.")
-                return
-
             # Prepare API manager
             api_manager = ApiManager(api_keys)
 
@@ -171,66 +293,130 @@ class VideoAnalyzerApp:
             output_path = os.path.join(os.getcwd(), "study_guide.txt")
             self._log(f"Kết quả sẽ được ghi vào: {output_path}")
 
+            course_root = os.path.abspath(course_path)
+            analysed = None if force_rerun else _analysed_videos(output_path, course_root)
+            if analysed is None and not force_rerun and os.path.exists(output_path):
+                self._log("study_guide.txt hiện có thuộc khóa học khác và sẽ được ghi đè.")
+            skipped = [0]
+            if analysed:
+                def skip_analysed(entries: Iterator[Tuple[str, Dict[str, Optional[str]]]]):
+                    for folder_name, entry in entries:
+                        if (folder_name, entry["basename"]) in analysed:
+                            self._log(f"Bỏ qua video đã có: {entry['basename']}")
+                            skipped[0] += 1
+                            continue
+                        yield folder_name, entry
+
+                course_entries = skip_analysed(course_entries)
+
             token_limit_videos: List[str] = []
 
-            with open(output_path, "w", encoding="utf-8") as out_file:
-                for folder_name, videos in course_structure.items():
-                    out_file.write(f"# {folder_name}\n")
-                    for entry in videos:
-                        video_path = entry["video"]
-                        subtitle_path = entry["subtitle"]
-                        text_path = entry["text"]
-
-                        self._log(f"Phân tích video: {os.path.basename(video_path)}")
-
-                        # Acquire an API key upfront so it can be reused for
-                        # both transcription and analysis calls.
-                        key = api_manager.get_active_key()
-                        if not key:
-                            self._log("Hết API key hoạt động. Dừng phân tích.")
-                            return
-
-                        # Collect text content
-                        content_parts: List[str] = []
-                        if subtitle_path:
-                            content_parts.append(read_text_file(subtitle_path))
-                        if text_path and text_path != subtitle_path:
-                            content_parts.append(read_text_file(text_path))
-                        if not content_parts:
-                            transcript = extract_audio_and_transcribe(video_path, key)
-                            if transcript:
-                                content_parts.append(transcript)
-                            else:
-                                self._log(f"Không thể trích xuất âm thanh cho video: {video_path}")
-                        combined_content = "\n".join(content_parts)
-
-                        # Compose prompt
-                        prompt = f"{system_instruction}\n\nNội dung video:\n{combined_content}".strip()
-                        if extra_prompt:
-                            prompt += f"\n\n{extra_prompt}"
-
-                        try:
-                            response = call_api(prompt, key)
-                            # Check for token limit marker in response; this is heuristic
-                            if isinstance(response, str) and "TOKEN_LIMIT" in response:
-                                token_limit_videos.append(os.path.basename(video_path))
-                                self._log(f"Video vượt quá giới hạn token: {video_path}")
-                            else:
-                                out_file.write(f"\n## {os.path.basename(video_path)}\n")
-                                out_file.write(response.strip() + "\n")
-                        except Exception as exc:
-                            # If an API error occurs, disable current key and retry once
-                            self._log(f"Lỗi khi gọi API với khóa {key}: {exc}")
-                            api_manager.disable_current_key()
-                            continue
+            # Folders are listed during the analysis, so listing errors
+            # surface from it; they are told apart from write failures here.
+            listing_errors: List[OSError] = []
+
+            def record_listing_errors(entries: Iterator[Tuple[str, Dict[str, Optional[str]]]]):
+                try:
+                    yield from entries
+                except OSError as e:
+                    listing_errors.append(e)
+                    raise
+
+            course_entries = record_listing_errors(course_entries)
+
+            try:
+                with open(output_path, "wb" if analysed is None else "ab", buffering=1 << 20) as out_file:
+                    if analysed is None:
+                        out_file.write(_GUIDE_COURSE_LINE.format(course_root).encode("utf-8"))
+                    current_folder: List[Optional[str]] = [None]
+                    # Encoded output not yet written; flushed once per folder
+                    # or every WRITE_BATCH videos so the file grows in few,
+                    # large writes while still showing progress.
+                    pending: List[bytes] = []
+
+                    def flush_pending() -> None:
+                        if pending:
+                            out_file.write(b"".join(pending))
+                            out_file.flush()
+                            pending.clear()
+
+                    def write_result(folder_name: str, record: Dict[str, Optional[str]]) -> None:
+                        # Results arrive in course order, so a new folder name
+                        # means the previous folder is complete.
+                        if folder_name != current_folder[0]:
+                            flush_pending()
+                            pending.append(f"# {folder_name}\n".encode("utf-8"))
+                            current_folder[0] = folder_name
+                        video_path = record["video"]
+                        response = record["analysis"]
+                        if record["error"] is not None:
+                            self._log(f"Lỗi khi gọi API cho video {record['basename']}: {record['error']}")
+                        elif response == NO_CONTENT:
+                            self._log(f"Bỏ qua video không có nội dung để phân tích: {record['basename']}")
+                        # Check for token limit marker in response; this is heuristic
+                        elif isinstance(response, str) and "TOKEN_LIMIT" in response:
+                            token_limit_videos.append(record["basename"])
+                            self._log(f"Video vượt quá giới hạn token: {video_path}")
+                        else:
+                            pending.append(f"\n## {record['basename']}\n{response.strip()}\n".encode("utf-8"))
+                            if len(pending) >= WRITE_BATCH:
+                                flush_pending()
+
+                    # Videos are analysed concurrently on an event loop owned
+                    # by this worker thread, multiplexed over one HTTP/2
+                    # connection with REQUESTS_PER_KEY in flight per API key.
+                    try:
+                        results = asyncio.run(analyze_course_async(
+                            course_entries,
+                            system_instruction,
+                            extra_prompt,
+                            api_manager,
+                            concurrency=len(api_keys) * REQUESTS_PER_KEY,
+                            use_cache=use_cache,
+                            on_result=write_result,
+                            log=self._log,
+                            cancel_event=self._cancel_event,
+                        ))
+                    finally:
+                        # Keep whatever was analysed, even if the run failed
+                        flush_pending()
+            except Exception as e:
+                if listing_errors and e is listing_errors[0]:
+                    self._log(f"Lỗi khi quét thư mục: {e}")
+                elif isinstance(e, OSError):
+                    self._log(f"Lỗi khi ghi kết quả vào {output_path}: {e}")
+                else:
+                    self._log(f"Lỗi trong quá trình phân tích: {e}")
+                return
+
+            if self._cancel_event.is_set():
+                self._log("Đã dừng phân tích. Các kết quả đã có được giữ lại.")
+                return
+
+            if not results:
+                if skipped[0]:
+                    self._log("Tất cả video đã có trong study_guide.txt.")
+                else:
+                    self._log("Không tìm thấy video nào trong thư mục đã chọn.")
+                return
+
+            keys_exhausted = api_manager.get_active_key() is None
+            if keys_exhausted:
+                self._log("Hết API key hoạt động. Dừng phân tích.")
 
             if token_limit_videos:
                 self._log("Một số video vượt quá giới hạn token và không được xử lý:")
                 for vid in token_limit_videos:
                     self._log(f" - {vid}")
 
-            self._log("Hoàn thành phân tích toàn bộ thư mục!")
+            if not keys_exhausted:
+                self._log("Hoàn thành phân tích toàn bộ thư mục!")
         finally:
             # Re-enable start button regardless of outcome
-            self.analysis_in_progress = False
-            self.master.after(0, lambda: self.start_button.configure(state='normal'))
+            with self._state_lock:
+                self.analysis_in_progress = False
+            self.master.after_idle(self._reset_buttons)
+
+    def _reset_buttons(self) -> None:
+        self.start_button.configure(state='normal')
+        self.stop_button.configure(state='disabled')